@@ -1,16 +1,24 @@
 import os
+import asyncio
 import logging
 import re
 from datetime import datetime, timedelta
+from typing import Optional
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, Job, filters
+from apscheduler.events import EVENT_JOB_MISSED
+from apscheduler.jobstores.base import JobLookupError
 import gspread
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
 from oauth2client.service_account import ServiceAccountCredentials
+from requests.adapters import HTTPAdapter
 import pytz
-import json
+import orjson
+from cachetools import TTLCache
 import time
-from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 
 # Load environment variables
 load_dotenv(dotenv_path='.env')
@@ -29,18 +37,51 @@ COLUMN_DATE = 4
 COLUMN_TIME = 5
 COLUMN_LOCATION = 7
 COLUMN_HR_CONTACT = 8
-COLUMN_DAY_BEFORE = 9
-COLUMN_TODAY = 11
-COLUMN_HOUR_BEFORE = 10
 COLUMN_CHAT_ID = 15
-COLUMN_SENT_REMINDERS = 16  # New column for tracking sent reminders
+COLUMN_SENT_REMINDERS = 16  # Reminder schedule, statuses and responses as JSON
 COLUMN_INTERVIEW_RESULT = 12  # Column for interview result
 
+# Reminder types in the order they are sent
+REMINDER_TYPES = ['day_before', 'hour_before', 'today', 'after_interview']
+REMINDER_GRACE = 60  # Reminders missed by up to a minute are still sent
+
+# Keyboards never change, so build them once
+SHARE_CONTACT_KEYBOARD = ReplyKeyboardMarkup(
+    [[KeyboardButton("📲 Отправить контакт", request_contact=True)]],
+    one_time_keyboard=True,
+    resize_keyboard=True
+)
+REMOVE_KEYBOARD = ReplyKeyboardRemove()
+CONFIRM_KEYBOARDS = {
+    reminder_type: InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("Да", callback_data=f"confirm_yes_{reminder_type}"),
+            InlineKeyboardButton("Нет", callback_data=f"confirm_no_{reminder_type}")
+        ]
+    ])
+    for reminder_type in REMINDER_TYPES if reminder_type != 'after_interview'  # Answered with RESULT_KEYBOARD
+}
+# callback_data of the confirmation buttons -> (response, reminder_type)
+CONFIRM_CALLBACKS = {
+    f"confirm_{response}_{reminder_type}": (response, reminder_type)
+    for response in ('yes', 'no')
+    for reminder_type in CONFIRM_KEYBOARDS
+}
+RESULT_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("Да ✅", callback_data="result_yes"),
+        InlineKeyboardButton("Нет ❌", callback_data="result_no"),
+        InlineKeyboardButton("Думаю 🤔", callback_data="result_thinking")
+    ]
+])
+
 
 # Check environment variables
 CREDENTIALS_FILE = os.getenv('GOOGLE_SHEETS_CREDENTIALS_FILE')
 SPREADSHEET_ID = os.getenv('SPREADSHEET_ID')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Public HTTPS address of the bot, polling is used if not set
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
 
 print("Текущий токен:", TELEGRAM_TOKEN)
 
@@ -60,6 +101,10 @@ SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 try:
     credentials = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, SCOPES)
     client = gspread.authorize(credentials)
+    # Reuse pooled keep-alive connections instead of a new TLS handshake per call
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8, max_retries=3)
+    client.session.mount('https://', adapter)
+    client.session.headers['Connection'] = 'keep-alive'
     sheet = client.open_by_key(SPREADSHEET_ID).sheet1
     logger.info("Successfully connected to Google Sheets")
 except Exception as e:
@@ -69,29 +114,153 @@ except Exception as e:
 # Set timezone
 TZ = pytz.timezone('Asia/Tashkent')
 
-# Добавим кэширование для уменьшения количества запросов
-def get_cached_phone_numbers():
+# gspread is blocking, so its calls run in threads sized to the HTTP connection pool
+SHEETS_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix='sheets')
+
+def _sync(fn, *args, **kwargs):
+    """Run a blocking call in the sheets executor without blocking the event loop."""
+    return asyncio.get_running_loop().run_in_executor(SHEETS_EXECUTOR, partial(fn, *args, **kwargs))
+
+# Limit concurrent API traffic to stay under the Sheets quota and Telegram flood limits
+SHEETS_SEM = asyncio.Semaphore(5)
+TG_SEM = asyncio.Semaphore(30)
+SHEETS_RETRIES = 4
+
+async def sheets_call(fn, *args, **kwargs):
+    """Run a gspread call with bounded concurrency, backing off on quota and server errors."""
+    for attempt in range(SHEETS_RETRIES):
+        try:
+            async with SHEETS_SEM:
+                return await _sync(fn, *args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            status = e.response.status_code
+            if (status != 429 and status < 500) or attempt == SHEETS_RETRIES - 1:
+                raise
+            delay = 2 ** attempt
+            logger.warning(f"Sheets API returned {status}, retrying in {delay}s")
+            await asyncio.sleep(delay)
+
+def column_range(col: int, last_col: Optional[int] = None) -> str:
+    """Return the A1 range of whole columns, e.g. 3 -> 'C:C' or 1, 8 -> 'A:H'."""
+    first = rowcol_to_a1(1, col)[:-1]
+    last = rowcol_to_a1(1, last_col)[:-1] if last_col else first
+    return f"{first}:{last}"
+
+# Index of normalized phone number -> sheet row, so lookups don't hit the API
+PHONE_INDEX: dict[str, int] = {}
+# Reverse index of registered chat_id -> sheet row
+CHAT_ID_TO_ROW: dict[int, int] = {}
+# Interview details entered by HR, by sheet row
+INTERVIEWS: dict[int, dict] = {}
+PHONE_INDEX_TTL = 300  # Rebuild the indexes every 5 minutes
+
+# Columns A..HR contact hold everything HR enters for an interview
+INTERVIEW_RANGE = column_range(1, COLUMN_HR_CONTACT)
+
+def refresh_phone_index() -> None:
+    """Rebuild the phone, interview and chat_id indexes from the sheet."""
+    interview_rows, chat_id_rows = sheet.batch_get([INTERVIEW_RANGE, column_range(COLUMN_CHAT_ID)])
+    index_interviews(interview_rows)
+    index_chat_ids(chat_id_rows)
+
+def parse_interview(values) -> dict:
+    """Return the interview details from the A..HR contact values of a row."""
+    values = list(values) + [''] * (COLUMN_HR_CONTACT - len(values))  # Trailing empty cells are omitted
+    return {
+        'name': values[NAME - 1],
+        'phone': values[COLUMN_PHONE - 1],
+        'date_str': values[COLUMN_DATE - 1],
+        'time_str': values[COLUMN_TIME - 1],
+        'location': values[COLUMN_LOCATION - 1],
+        'hr_contact': values[COLUMN_HR_CONTACT - 1],
+    }
+
+def index_interviews(interview_rows) -> None:
+    """Replace the phone index and interview details with ones built from the interview columns."""
+    global PHONE_INDEX, INTERVIEWS
+    phone_index = {}
+    interviews = {}
+    for i, values in enumerate(interview_rows, 1):
+        interview = parse_interview(values)
+        interviews[i] = interview
+        if interview['phone']:
+            phone_index.setdefault(normalize_phone(interview['phone']), i)  # Keep the first match, like the old scan
+    PHONE_INDEX = phone_index
+    INTERVIEWS = interviews
+    logger.info(f"Phone index rebuilt with {len(PHONE_INDEX)} numbers")
+
+async def read_interview(row: int) -> dict:
+    """Read the interview details of a single row from the sheet."""
+    values = await sheets_call(sheet.get, f"{rowcol_to_a1(row, 1)}:{rowcol_to_a1(row, COLUMN_HR_CONTACT)}")
+    interview = parse_interview(values[0] if values else [])
+    INTERVIEWS[row] = interview
+    return interview
+
+def index_chat_ids(chat_id_rows) -> None:
+    """Replace the chat_id index with one built from the values of the chat_id column."""
+    global CHAT_ID_TO_ROW
+    new_rows = {}
+    for i, values in enumerate(chat_id_rows, 1):
+        if values and values[0].lstrip('-').isdigit():
+            new_rows[int(values[0])] = i
+    old_rows = CHAT_ID_TO_ROW
+    CHAT_ID_TO_ROW = new_rows  # Rebind, so chats of deleted or overwritten rows are dropped
+    if any(new_rows.get(chat_id) != row for chat_id, row in old_rows.items()):
+        forget_moved_rows(old_rows, new_rows)
+
+def forget_moved_rows(old_rows: dict[int, int], new_rows: dict[int, int]) -> None:
+    """Drop state keyed by row number after HR moved rows, moving queued writes along with their chats."""
+    CELL_CACHE.clear()
+    chats_by_row = {row: chat_id for chat_id, row in old_rows.items()}
+    pending = dict(PENDING_WRITES)
+    PENDING_WRITES.clear()
+    for cell, value in pending.items():
+        row, col = a1_to_rowcol(cell)
+        chat_id = chats_by_row.get(row)
+        new_row = new_rows.get(chat_id) if chat_id else row
+        if new_row:  # Drop writes of chats that are no longer in the sheet
+            PENDING_WRITES[rowcol_to_a1(new_row, col)] = value
+    logger.info("Rows were moved in the sheet, dropped row-keyed caches")
+
+async def find_chat_row(chat_id: int) -> int:
+    """Return the sheet row registered for a chat."""
+    row = CHAT_ID_TO_ROW.get(chat_id)
+    if row:
+        return row
+    # Exact match on the whole column, read once and reindexed for the other chats too
+    index_chat_ids(await sheets_call(sheet.get, column_range(COLUMN_CHAT_ID)))
+    row = CHAT_ID_TO_ROW.get(chat_id)
+    if not row:
+        raise ValueError(f"Chat ID {chat_id} not found in sheet")
+    return row
+
+async def resolve_chat_row(chat_id: int) -> int:
+    """Return the row of a chat, checking the sheet in case HR moved rows since it was indexed."""
+    row = CHAT_ID_TO_ROW.get(chat_id)
+    if row and (await sheets_call(sheet.cell, row, COLUMN_CHAT_ID)).value == str(chat_id):
+        return row
+    # Rows were moved, so values cached by row number can't be trusted either
+    CHAT_ID_TO_ROW.pop(chat_id, None)
+    CELL_CACHE.clear()
+    return await find_chat_row(chat_id)
+
+async def refresh_phone_index_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Periodically rebuild the phone and interview indexes."""
     try:
-        time.sleep(1)  # Симуляция задержки
-        # Получаем данные из указанного столбца (без кэширования)
-        phone_numbers = sheet.col_values(COLUMN_PHONE)
-        print(f"Загружены данные: {phone_numbers}")  # Для отладки
-        return phone_numbers
+        await sheets_call(refresh_phone_index)
     except Exception as e:
-        print(f"Ошибка при получении данных: {e}")
-        return []  # В случае ошибки возвращаем пустой список
+        logger.error(f"Failed to refresh phone index: {str(e)}", exc_info=True)
+
+_NON_DIGIT = re.compile(r'\D')
 
 def normalize_phone(phone):
     """Normalize phone number by removing all non-digit characters."""
     if not phone:
         return ""
-    return re.sub(r'\D', '', phone)
+    return _NON_DIGIT.sub('', phone)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /start command."""
-    keyboard = [[KeyboardButton("📲 Отправить контакт", request_contact=True)]]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
     # Отправляем инструкцию с эмодзи
     instruction = """Добро пожаловать! 👋
 
@@ -105,7 +274,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     
     await update.message.reply_text(
         instruction,
-        reply_markup=reply_markup
+        reply_markup=SHARE_CONTACT_KEYBOARD
     )
 
 async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -117,7 +286,7 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             logger.warning("User pressed share button but didn't send contact")
             await update.message.reply_text(
                 "Пожалуйста, нажмите кнопку и отправьте свой номер телефона.",
-                reply_markup=ReplyKeyboardRemove()
+                reply_markup=REMOVE_KEYBOARD
             )
             return
             
@@ -130,49 +299,47 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         logger.info(f"Received phone: {phone}, normalized to: {normalized_phone}")
         
         try:
-            # Используем кэшированные номера телефонов
-            phone_column = get_cached_phone_numbers()
-            logger.info(f"Found {len(phone_column)} phone numbers in sheet")
-            
-            row = None
-            for i, sheet_phone in enumerate(phone_column, 1):
-                if sheet_phone and normalize_phone(sheet_phone) == normalized_phone:
-                    row = i
-                    logger.info(f"Found matching phone in row {i}")
-                    break
+            # Serve the details read by the last rebuild, they are at most PHONE_INDEX_TTL old
+            row = PHONE_INDEX.get(normalized_phone)
+            interview = INTERVIEWS.get(row) if row else None
+            if not interview or normalize_phone(interview['phone']) != normalized_phone:
+                # The number was added or rows were moved after the last rebuild
+                await sheets_call(refresh_phone_index)
+                row = PHONE_INDEX.get(normalized_phone)
+                interview = INTERVIEWS.get(row) if row else None
+            if row:
+                logger.info(f"Found matching phone in row {row}")
             
             if not row:
                 logger.error(f"Phone number {normalized_phone} not found in sheet")
                 raise ValueError("Phone number not found")
             
-            try:
-                time.sleep(1)  # Добавляем задержку перед обновлением
-                sheet.update_cell(row, COLUMN_CHAT_ID, str(chat_id))
-                logger.info(f"Successfully updated chat_id to {chat_id}")
-            except Exception as e:
-                logger.error(f"Failed to update chat_id: {str(e)}", exc_info=True)
-                raise
-            
-            # Get interview details
-            name = sheet.cell(row, NAME).value
-            date_str = sheet.cell(row, COLUMN_DATE).value
-            time_str = sheet.cell(row, COLUMN_TIME).value
-            location = sheet.cell(row, COLUMN_LOCATION).value
-            hr_contact = sheet.cell(row, COLUMN_HR_CONTACT).value
+            name = interview['name']
+            date_str = interview['date_str']
+            time_str = interview['time_str']
+            location = interview['location']
+            hr_contact = interview['hr_contact']
             
             if not date_str or not time_str:
                 logger.error(f"Missing date or time for row {row}")
+                await sheets_call(sheet.update_cell, row, COLUMN_CHAT_ID, str(chat_id))
                 await update.message.reply_text(
                     "Информация о дате или времени собеседования отсутствует. Свяжитесь с HR.",
-                    reply_markup=ReplyKeyboardRemove()
+                    reply_markup=REMOVE_KEYBOARD
                 )
                 return
             
             # Parse interview datetime
             try:
-                interview_date = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M:%S")
+                try:
+                    interview_date = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M:%S")
+                except ValueError:
+                    interview_date = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
             except ValueError:
-                interview_date = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
+                # Still record the chat, as before the details were read, so HR can reach the candidate
+                logger.error(f"Invalid date or time format for row {row}: {date_str} {time_str}")
+                await sheets_call(sheet.update_cell, row, COLUMN_CHAT_ID, str(chat_id))
+                raise
             
             interview_date = TZ.localize(interview_date)
             
@@ -184,16 +351,40 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             
             # Create sent_reminders object with scheduled times
             sent_reminders = {
-                'day_before': day_before.strftime("%Y-%m-%d %H:%M:%S"),
-                'hour_before': hour_before.strftime("%Y-%m-%d %H:%M:%S"),
-                'today': today.strftime("%Y-%m-%d %H:%M:%S"),
-                'after_interview': after_interview.strftime("%Y-%m-%d %H:%M:%S")  # New reminder time
+                'scheduled': {
+                    'day_before': int(day_before.timestamp()),
+                    'hour_before': int(hour_before.timestamp()),
+                    'today': int(today.timestamp()),
+                    'after_interview': int(after_interview.timestamp())  # New reminder time
+                },
+                'status': {},
+                'response': {},
+                # Interview details, so reminders can be sent without reading the sheet
+                'date_str': date_str,
+                'time_str': time_str,
+                'location': location
             }
             
-            # Update sent_reminders in sheet
-            sheet.update_cell(row, COLUMN_SENT_REMINDERS, json.dumps(sent_reminders))
+            # Update chat_id and sent_reminders in sheet with a single request
+            sent_reminders_str = orjson.dumps(sent_reminders).decode()
+            try:
+                # Wait for a flush in flight, so it can't land after the new schedule and overwrite it
+                async with FLUSH_LOCK:
+                    PENDING_WRITES.pop(rowcol_to_a1(row, COLUMN_SENT_REMINDERS), None)  # Superseded by the new schedule
+                    await sheets_call(sheet.batch_update, [
+                        {'range': rowcol_to_a1(row, COLUMN_CHAT_ID), 'values': [[str(chat_id)]]},
+                        {'range': rowcol_to_a1(row, COLUMN_SENT_REMINDERS), 'values': [[sent_reminders_str]]},
+                    ], value_input_option='USER_ENTERED')
+                CELL_CACHE[(row, COLUMN_SENT_REMINDERS)] = sent_reminders_str
+                logger.info(f"Successfully updated chat_id to {chat_id}")
+            except Exception as e:
+                logger.error(f"Failed to update chat_id: {str(e)}", exc_info=True)
+                raise
             logger.info(f"Updated sent_reminders with scheduled times: {sent_reminders}")
             
+            CHAT_ID_TO_ROW[chat_id] = row
+            schedule_reminders(context.job_queue, chat_id, sent_reminders)
+            
             # Format the message with name if available
             greeting = f"Здравствуйте, {name}!\n\n" if name else "Здравствуйте!\n\n"
             message = (
@@ -209,7 +400,7 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 f"- В день собеседования ({today.strftime('%Y-%m-%d %H:%M')})\n"
             )
             
-            await update.message.reply_text(message, reply_markup=ReplyKeyboardRemove())
+            await update.message.reply_text(message, reply_markup=REMOVE_KEYBOARD)
             logger.info("Initial message with reminder times sent successfully")
             
         except ValueError as e:
@@ -217,110 +408,246 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 logger.error(f"Phone number {normalized_phone} not found in sheet")
                 await update.message.reply_text(
                     "Ваш номер телефона не найден в базе данных. Пожалуйста, свяжитесь с HR.",
-                    reply_markup=ReplyKeyboardRemove()
+                    reply_markup=REMOVE_KEYBOARD
                 )
             else:
                 logger.error(f"Error: {str(e)}", exc_info=True)
                 await update.message.reply_text(
                     "Произошла ошибка при поиске ваших данных. Пожалуйста, свяжитесь с HR.",
-                    reply_markup=ReplyKeyboardRemove()
+                    reply_markup=REMOVE_KEYBOARD
                 )
     except Exception as e:
         logger.error(f"Unexpected error in handle_contact: {str(e)}", exc_info=True)
         await update.message.reply_text(
             "Произошла неожиданная ошибка. Пожалуйста, свяжитесь с HR.",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=REMOVE_KEYBOARD
+        )
+
+# Short-lived cache of single-cell reads, so a sheet stalled by a human editor doesn't delay reminders
+CELL_CACHE = TTLCache(maxsize=2048, ttl=300)
+
+async def cached_cell(row: int, col: int):
+    """Read a cell value through CELL_CACHE."""
+    key = (row, col)
+    value = CELL_CACHE.get(key)
+    if value is None:
+        value = (await sheets_call(sheet.cell, row, col)).value
+        CELL_CACHE[key] = value
+    return value
+
+# Reminders JSON writes waiting to be sent together, by cell
+PENDING_WRITES: dict[str, str] = {}
+FLUSH_DELAY = 1  # Writes queued within a second of each other share one request
+FLUSH_MAX_DELAY = 300  # Longest wait between retries of a failed flush
+FLUSH_DUE_TS = None  # When the scheduled flush is due, None if no flush is scheduled
+FLUSH_FAILURES = 0
+# Held while queued writes are sent, so direct writes of the same cells can't be overwritten by them
+FLUSH_LOCK = asyncio.Lock()
+
+async def read_reminders(row: int) -> dict:
+    """Read the reminders JSON of a row, preferring a write that is still queued."""
+    reminders_str = PENDING_WRITES.get(rowcol_to_a1(row, COLUMN_SENT_REMINDERS))
+    if reminders_str is None:
+        reminders_str = await cached_cell(row, COLUMN_SENT_REMINDERS)
+    return parse_reminders(reminders_str)
+
+def queue_reminders_write(job_queue, row: int, reminders: dict) -> None:
+    """Queue the reminders JSON of a row to be written with the next batch."""
+    reminders_str = orjson.dumps(reminders).decode()
+    PENDING_WRITES[rowcol_to_a1(row, COLUMN_SENT_REMINDERS)] = reminders_str
+    CELL_CACHE[(row, COLUMN_SENT_REMINDERS)] = reminders_str
+    schedule_flush(job_queue, FLUSH_DELAY)
+
+async def update_reminders(job_queue, row: int, **changes: dict) -> None:
+    """Apply per-key changes to sections of a row's reminders JSON and queue the write."""
+    reminders = await read_reminders(row)
+    # Another event may have queued a write while the sheet was being read, so build on it
+    pending = PENDING_WRITES.get(rowcol_to_a1(row, COLUMN_SENT_REMINDERS))
+    if pending is not None:
+        reminders = parse_reminders(pending)
+    for section, values in changes.items():
+        reminders[section].update(values)
+    queue_reminders_write(job_queue, row, reminders)
+
+def schedule_flush(job_queue, delay: float) -> None:
+    """Schedule a flush of the queued writes unless one is already due."""
+    global FLUSH_DUE_TS
+    now_ts = time.time()
+    # A flush overdue by more than its grace time was dropped by the scheduler, so schedule a new one
+    if FLUSH_DUE_TS is not None and now_ts < FLUSH_DUE_TS + REMINDER_GRACE:
+        return
+    FLUSH_DUE_TS = now_ts + delay
+    job_queue.run_once(
+        flush_pending_writes_job,
+        when=delay,
+        name='flush_pending_writes',
+        job_kwargs={'misfire_grace_time': REMINDER_GRACE}
+    )
+
+async def flush_pending_writes() -> None:
+    """Write all queued cells with a single batch_update."""
+    async with FLUSH_LOCK:
+        batch = dict(PENDING_WRITES)
+        if not batch:
+            return
+        await sheets_call(sheet.batch_update, [
+            {'range': cell, 'values': [[value]]} for cell, value in batch.items()
+        ], value_input_option='USER_ENTERED')
+        # Keep cells that were queued again while the request was in flight
+        for cell, value in batch.items():
+            if PENDING_WRITES.get(cell) is value:
+                del PENDING_WRITES[cell]
+        logger.info(f"Flushed {len(batch)} queued writes")
+
+async def flush_pending_writes_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Flush queued writes shortly after the first of them was queued, retrying with backoff."""
+    global FLUSH_DUE_TS, FLUSH_FAILURES
+    FLUSH_DUE_TS = None
+    try:
+        await flush_pending_writes()
+        FLUSH_FAILURES = 0
+    except Exception as e:
+        FLUSH_FAILURES += 1
+        delay = min(FLUSH_DELAY * 2 ** FLUSH_FAILURES, FLUSH_MAX_DELAY)
+        logger.error(f"Failed to flush queued writes, retrying in {delay}s: {str(e)}", exc_info=True)
+        schedule_flush(context.job_queue, delay)
+
+async def flush_on_shutdown(application: Application) -> None:
+    """Write whatever is still queued before the bot stops."""
+    try:
+        await flush_pending_writes()
+    except Exception as e:
+        logger.error(f"Failed to flush queued writes on shutdown: {str(e)}", exc_info=True)
+
+# Pending reminder jobs by name, so rescheduling doesn't scan the whole job queue
+REMINDER_JOBS: dict[str, Job] = {}
+
+def forget_missed_job(event) -> None:
+    """Drop a reminder job that the scheduler skipped as missed from REMINDER_JOBS."""
+    for name, job in list(REMINDER_JOBS.items()):
+        if job.job.id == event.job_id:
+            del REMINDER_JOBS[name]
+            logger.warning(f"Reminder job {name} was missed")
+            break
+
+def parse_reminders(reminders_str: str) -> dict:
+    """Parse the reminders JSON, upgrading the flat layout used before statuses moved into it."""
+    reminders = orjson.loads(reminders_str) if reminders_str else {}
+    if 'scheduled' not in reminders:
+        reminders['scheduled'] = {reminder_type: reminders.pop(reminder_type, None) for reminder_type in REMINDER_TYPES}
+    reminders.setdefault('status', {})
+    reminders.setdefault('response', {})
+    return reminders
+
+def schedule_reminders(job_queue, chat_id: int, reminders: dict) -> None:
+    """Schedule a one-off job for every reminder that is still pending."""
+    now_ts = time.time()
+    for reminder_type in REMINDER_TYPES:
+        name = f"{chat_id}_{reminder_type}"
+        
+        # Drop the job left from a previous registration of the same chat
+        old_job = REMINDER_JOBS.pop(name, None)
+        if old_job:
+            try:
+                old_job.schedule_removal()
+            except JobLookupError:  # Already dropped by the scheduler as missed
+                pass
+        
+        scheduled_ts = reminders['scheduled'].get(reminder_type)
+        if not scheduled_ts:  # Skip if this reminder is already sent
+            continue
+        
+        if isinstance(scheduled_ts, str):  # Saved before epoch timestamps were used
+            scheduled_ts = TZ.localize(datetime.strptime(scheduled_ts, "%Y-%m-%d %H:%M:%S")).timestamp()
+        delay = scheduled_ts - now_ts
+        if delay < -REMINDER_GRACE:  # Too late to send it
+            continue
+        
+        REMINDER_JOBS[name] = job_queue.run_once(
+            send_reminder_job,
+            when=max(delay, 0),
+            data={'chat_id': chat_id, 'type': reminder_type},
+            name=name,
+            job_kwargs={'misfire_grace_time': REMINDER_GRACE}  # APScheduler drops jobs late by more than 1 s otherwise
         )
+        logger.info(f"Scheduled {reminder_type} reminder for chat {chat_id} in {delay:.0f}s")
 
-async def check_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Check the sheet for reminders that need to be sent."""
+async def send_reminder_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send a scheduled reminder and mark it as sent in the sheet."""
+    job_data = context.job.data
+    chat_id = job_data['chat_id']
+    reminder_type = job_data['type']
+    row = None
+    if REMINDER_JOBS.get(context.job.name) is context.job:
+        del REMINDER_JOBS[context.job.name]
+    
     try:
-        current_time = datetime.now(TZ)
-        logger.info(f"Checking reminders at: {current_time}")
+        # Resolve the row now, the sheet may have been reordered since the reminder was scheduled
+        row = await resolve_chat_row(chat_id)
+        
+        # Get reminder times from column P (COLUMN_SENT_REMINDERS)
+        reminders = await read_reminders(row)
+        if not reminders['scheduled'].get(reminder_type):
+            logger.info(f"{reminder_type} reminder for row {row} is no longer pending")
+            return
         
-        # Get all rows with chat_ids
-        chat_ids = sheet.col_values(COLUMN_CHAT_ID)
+        if 'date_str' not in reminders:  # Registered before interview details were stored in JSON
+            interview = INTERVIEWS.get(row) or await read_interview(row)
+            reminders['date_str'] = interview['date_str']
+            reminders['time_str'] = interview['time_str']
+            reminders['location'] = interview['location']
+        
+        await send_reminder(context, chat_id, reminders['location'], reminder_type,
+                            reminders['date_str'], reminders['time_str'])
+        
+        # Mark as sent and remove the scheduled time by setting it to null, keeping
+        # responses that arrived while the message was being sent
+        await update_reminders(
+            context.job_queue, row,
+            status={reminder_type: "Отправлено"},
+            scheduled={reminder_type: None}
+        )
+        
+        logger.info(f"Updated reminder status and removed date for {reminder_type} in row {row}")
+    except Exception as e:
+        logger.error(f"Error in send_reminder_job for chat {chat_id}, row {row}: {str(e)}", exc_info=True)
+
+def restore_reminders(job_queue) -> None:
+    """Build the indexes and reschedule pending reminders from the sheet after a restart."""
+    try:
+        # Get interviews, chat_ids and reminders of all rows with a single request
+        interview_rows, chat_id_rows, reminder_rows = sheet.batch_get(
+            [INTERVIEW_RANGE, column_range(COLUMN_CHAT_ID), column_range(COLUMN_SENT_REMINDERS)]
+        )
+        index_interviews(interview_rows)
+        index_chat_ids(chat_id_rows)
         
-        for row, chat_id in enumerate(chat_ids, 1):
-            if not chat_id or chat_id == "chat_id":  # Skip empty cells and header
+        for row, (chat_id_row, reminder_row) in enumerate(zip(chat_id_rows, reminder_rows), 1):
+            chat_id = chat_id_row[0] if chat_id_row else ''
+            reminders_str = reminder_row[0] if reminder_row else ''
+            if not chat_id or chat_id == "chat_id" or not reminders_str:  # Skip empty cells and header
                 continue
                 
             try:
-                # Get reminder times from column N (COLUMN_SENT_REMINDERS)
-                reminders_str = sheet.cell(row, COLUMN_SENT_REMINDERS).value
-                if not reminders_str:
-                    continue
-                    
-                reminders = json.loads(reminders_str)
-                location = sheet.cell(row, COLUMN_LOCATION).value
-                
-                # Check each reminder type
-                for reminder_type in ['day_before', 'hour_before', 'today', 'after_interview']:
-                    scheduled_time_str = reminders.get(reminder_type)
-                    if not scheduled_time_str:  # Skip if this reminder is already sent
-                        continue
-                        
-                    # Parse scheduled time
-                    scheduled_time = datetime.strptime(scheduled_time_str, "%Y-%m-%d %H:%M:%S")
-                    scheduled_time = TZ.localize(scheduled_time)
-                    
-                    # Calculate time difference in seconds
-                    time_diff = abs((current_time - scheduled_time).total_seconds())
-                    
-                    # Get the corresponding reminder column
-                    if reminder_type == 'day_before':
-                        reminder_column = COLUMN_DAY_BEFORE
-                    elif reminder_type == 'hour_before':
-                        reminder_column = COLUMN_HOUR_BEFORE
-                    elif reminder_type == 'today':
-                        reminder_column = COLUMN_TODAY
-                    else:  # after_interview
-                        reminder_column = COLUMN_INTERVIEW_RESULT
-                    
-                    # If within 1 minutes of scheduled time
-                    if time_diff <= 60:  # 60 seconds = 1 minutes
-                        logger.info(f"Sending {reminder_type} reminder to chat {chat_id}")
-                        await send_reminder(context, int(chat_id), location, reminder_type, row)
-                        
-                        # Mark as sent in the reminder column if not after_interview
-                        if reminder_type != 'after_interview':
-                            sheet.update_cell(row, reminder_column, "Отправлено")
-                        
-                        # Remove this reminder from JSON by setting it to null
-                        reminders[reminder_type] = None
-                        sheet.update_cell(row, COLUMN_SENT_REMINDERS, json.dumps(reminders))
-                        
-                        logger.info(f"Updated reminder status and removed date for {reminder_type} in row {row}")
-                        break  # Only send one reminder at a time
-                            
+                schedule_reminders(job_queue, int(chat_id), parse_reminders(reminders_str))
             except Exception as e:
                 logger.error(f"Error processing row {row}: {str(e)}", exc_info=True)
                 continue
                 
     except Exception as e:
-        logger.error(f"Error in check_reminders: {str(e)}", exc_info=True)
+        logger.error(f"Error in restore_reminders: {str(e)}", exc_info=True)
 
 async def send_reminder(context: ContextTypes.DEFAULT_TYPE, chat_id: int, location: str, 
-                       reminder_type: str, row: int) -> None:
+                       reminder_type: str, date_str: str, time_str: str) -> None:
     """Send reminder message and ask for confirmation."""
     try:
         logger.info(f"Sending {reminder_type} reminder to chat {chat_id}")
         
-        # Get interview details
-        date_str = sheet.cell(row, COLUMN_DATE).value
-        time_str = sheet.cell(row, COLUMN_TIME).value
-        
         if reminder_type == 'after_interview':
             message = (
                 "Как прошло собеседование? Вы принимаете предложение?"
             )
-            keyboard = [
-                [
-                    InlineKeyboardButton("Да ✅", callback_data=f"result_yes"),
-                    InlineKeyboardButton("Нет ❌", callback_data=f"result_no"),
-                    InlineKeyboardButton("Думаю 🤔", callback_data=f"result_thinking")
-                ]
-            ]
+            reply_markup = RESULT_KEYBOARD
         else:
             is_link = 'http' in location.lower()
             if is_link:
@@ -339,21 +666,15 @@ async def send_reminder(context: ContextTypes.DEFAULT_TYPE, chat_id: int, locati
                     f"📍 Адрес: {location}\n\n"
                     "Будете ли вы присутствовать на собеседовании?"
                 )
-            keyboard = [
-                [
-                    InlineKeyboardButton("Да", callback_data=f"confirm_yes_{reminder_type}"),
-                    InlineKeyboardButton("Нет", callback_data=f"confirm_no_{reminder_type}")
-                ]
-            ]
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = CONFIRM_KEYBOARDS[reminder_type]
         
         logger.info(f"Sending message to chat {chat_id}")
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=message,
-            reply_markup=reply_markup
-        )
+        async with TG_SEM:
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=message,
+                reply_markup=reply_markup
+            )
         logger.info("Message sent successfully")
     except Exception as e:
         logger.error(f"Error in send_reminder: {str(e)}", exc_info=True)
@@ -378,14 +699,10 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             }.get(result, 'Неизвестно')
             
             # Find the user's row
-            cell = sheet.find(str(update.effective_chat.id), in_column=COLUMN_CHAT_ID)
-            if not cell:
-                raise ValueError(f"Chat ID {update.effective_chat.id} not found in sheet")
-            
-            row = cell.row
+            row = await resolve_chat_row(update.effective_chat.id)
             
             # Update the result in column 12
-            sheet.update_cell(row, COLUMN_INTERVIEW_RESULT, result_text)
+            await sheets_call(sheet.update_cell, row, COLUMN_INTERVIEW_RESULT, result_text)
             
             # Send confirmation message
             if result == 'yes':
@@ -396,31 +713,17 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 message = "Спасибо за ваш ответ. Пожалуйста, сообщите о вашем решении HR."
         else:
             # Handle regular confirmation
-            parts = callback_data.split('_')
-            if len(parts) < 3:
+            parsed = CONFIRM_CALLBACKS.get(callback_data)
+            if not parsed:
                 raise ValueError(f"Invalid callback data format: {callback_data}")
                 
-            response = parts[1]  # "yes" or "no"
-            reminder_type = '_'.join(parts[2:])  # "day_before", "hour_before", or "today"
+            response, reminder_type = parsed  # "yes" or "no", and "day_before", "hour_before", or "today"
             
             # Find the user's row
-            cell = sheet.find(str(update.effective_chat.id), in_column=COLUMN_CHAT_ID)
-            if not cell:
-                raise ValueError(f"Chat ID {update.effective_chat.id} not found in sheet")
-            
-            row = cell.row
+            row = await resolve_chat_row(update.effective_chat.id)
             
-            # Determine which column to update based on reminder type
-            if reminder_type == 'day_before':
-                column = COLUMN_DAY_BEFORE
-            elif reminder_type == 'hour_before':
-                column = COLUMN_HOUR_BEFORE
-            else:  # today
-                column = COLUMN_TODAY
-                
-            # Update the response
-            response_text = "Да" if response == "yes" else "Нет"
-            sheet.update_cell(row, column, response_text)
+            # Update the response in the reminders JSON
+            await update_reminders(context.job_queue, row, response={reminder_type: response})
             
             # Send confirmation message
             if response == "yes":
@@ -439,7 +742,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 def main() -> None:
     """Start the bot."""
     # Create the Application and pass it your bot's token.
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = Application.builder().token(TELEGRAM_TOKEN).post_shutdown(flush_on_shutdown).build()
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
@@ -452,11 +755,23 @@ def main() -> None:
         logger.error("Job queue is not initialized!")
         return
 
-    # Schedule reminder checks every 15 seconds
-    job_queue.run_repeating(check_reminders, interval=15, first=0)
+    job_queue.scheduler.add_listener(forget_missed_job, EVENT_JOB_MISSED)
+
+    # Build the indexes and schedule reminders saved before the restart, then keep the indexes fresh
+    restore_reminders(job_queue)
+    job_queue.run_repeating(refresh_phone_index_job, interval=PHONE_INDEX_TTL, first=PHONE_INDEX_TTL)
 
     # Start the Bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=WEBHOOK_PORT,
+            url_path=TELEGRAM_TOKEN,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{TELEGRAM_TOKEN}",
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file